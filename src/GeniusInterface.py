@@ -1,6 +1,8 @@
 from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QWidget, QLabel, QLineEdit, QPushButton,
-                               QTableWidget, QTableWidgetItem, QMessageBox, QTabWidget, QHBoxLayout, QDialog)
-from PySide6.QtCore import Qt
+                               QTableWidget, QTableWidgetItem, QMessageBox, QTabWidget, QHBoxLayout, QDialog,
+                               QAbstractItemView, QProgressDialog, QApplication)
+from PySide6.QtCore import Qt, QTimer
+from repositories import QueryTimeoutError, QueryCancelledError, RecordNotFoundError
 
 
 class FilterDialog(QDialog):
@@ -47,6 +49,9 @@ class TableManager(QWidget):
         super().__init__(parent)
         self.controller = controller
         self.columns = controller.get_attr_names()
+        self.dirty_cells = {}
+        self.query_running = False
+        self.lazy_load_pending = False
         self.init_ui()
 
     def init_ui(self):
@@ -72,15 +77,22 @@ class TableManager(QWidget):
         self.table = QTableWidget()
         self.table.setColumnCount(self.controller.get_columns_count())
         self.table.setHorizontalHeaderLabels(self.controller.get_attr_names())
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.table.horizontalHeader().sectionClicked.connect(self.on_header_clicked)
+        self.table.itemChanged.connect(self.on_item_changed)
+        self.table.verticalScrollBar().valueChanged.connect(self.load_visible_lazy_cells)
         layout.addWidget(self.table)
 
         # Кнопки для редактирования и удаления
         button_layout = QHBoxLayout()
-        edit_button = QPushButton("Edit Selected")
+        edit_button = QPushButton("Save Changes")
         edit_button.clicked.connect(self.edit_record)
         button_layout.addWidget(edit_button)
 
+        discard_button = QPushButton("Discard Changes")
+        discard_button.clicked.connect(self.discard_changes)
+        button_layout.addWidget(discard_button)
+
         delete_button = QPushButton("Delete Selected")
         delete_button.clicked.connect(self.delete_record)
         button_layout.addWidget(delete_button)
@@ -97,21 +109,128 @@ class TableManager(QWidget):
             return
 
         model = self.controller.get_model(None, *values)
-        self.controller.add(model)
+        if not self.controller.add(model):
+            QMessageBox.warning(self, "Error", "The people number is more than the remaining places of the tour")
+            self.load_records()
+            return
         self.load_records()
         self.clear_inputs()
         QMessageBox.information(self, "Success", f"{self.controller.table_name} added successfully!")
 
     def load_records(self):
         records = self.controller.get_all()
+        # Unsaved edits of rows deleted meanwhile (here or by a cascade from another tab) cannot be saved
+        existing_ids = {list(record.__dict__.values())[0] for record in records}
+        self.dirty_cells = {record_id: changes for record_id, changes in self.dirty_cells.items()
+                            if record_id in existing_ids}
         self.update_table(records)
 
     def update_table(self, records):
+        lazy_columns = self.controller.get_lazy_columns()
+        self.table.blockSignals(True)
         self.table.setRowCount(len(records))
         for row, record in enumerate(records):
-            for col, value in enumerate(record.__dict__.values()):
-                item = QTableWidgetItem(str(value))
+            values = list(record.__dict__.values())
+            changes = self.dirty_cells.get(values[0], {})
+            for col, value in enumerate(values):
+                # Wide columns stay empty until the row scrolls into view
+                original = None if self.columns[col] in lazy_columns else str(value)
+                item = QTableWidgetItem(changes.get(col, original or ""))
+                item.setData(Qt.UserRole, original)
                 self.table.setItem(row, col, item)
+        self.table.blockSignals(False)
+        QTimer.singleShot(0, self.load_visible_lazy_cells)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.load_visible_lazy_cells()
+
+    def load_visible_lazy_cells(self):
+        if self.query_running:
+            # Called from processEvents inside the progress handler: the repository connection
+            # is still executing the guarded statement and must not be re-entered
+            self.lazy_load_pending = True
+            return
+        row_count = self.table.rowCount()
+        first_row = self.table.rowAt(0)
+        if not row_count or first_row == -1:
+            return
+        last_row = self.table.rowAt(self.table.viewport().height() - 1)
+        if last_row == -1:
+            last_row = row_count - 1
+
+        for column in self.controller.get_lazy_columns():
+            col = self.columns.index(column)
+            rows = [row for row in range(first_row, last_row + 1)
+                    if self.table.item(row, col).data(Qt.UserRole) is None]
+            if not rows:
+                continue
+            record_ids = [int(self.table.item(row, 0).text()) for row in rows]
+            values = self.controller.get_column_values(column, record_ids)
+            self.table.blockSignals(True)
+            for row, record_id in zip(rows, record_ids):
+                item = self.table.item(row, col)
+                value = str(values.get(record_id))
+                item.setData(Qt.UserRole, value)
+                item.setText(self.dirty_cells.get(record_id, {}).get(col, value))
+            self.table.blockSignals(False)
+
+    def revert_item(self, item):
+        self.table.blockSignals(True)
+        item.setText(item.data(Qt.UserRole) or "")
+        self.table.blockSignals(False)
+
+    def on_item_changed(self, item):
+        col = item.column()
+        if col == 0:
+            QMessageBox.warning(self, "Error", "You selected a primary key")
+            self.revert_item(item)
+            return
+        if not self.controller.validate_edit_permission(col):
+            QMessageBox.warning(self, "Error", "You don't have sufficient permissions to edit this cell")
+            self.revert_item(item)
+            return
+
+        record_id = int(self.table.item(item.row(), 0).text())
+        changes = self.dirty_cells.setdefault(record_id, {})
+        if item.text() == item.data(Qt.UserRole):
+            changes.pop(col, None)
+            if not changes:
+                del self.dirty_cells[record_id]
+        else:
+            changes[col] = item.text()
+
+    def discard_changes(self):
+        self.dirty_cells = {}
+        self.load_records()
+
+    def run_with_progress(self, label, func, *args, **kwargs):
+        dialog = QProgressDialog(label, "Cancel", 0, 0, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+
+        def on_progress(elapsed, budget):
+            if budget:
+                dialog.setMaximum(1000)
+                dialog.setValue(min(int(elapsed / budget * 1000), 999))
+            else:
+                dialog.setValue(0)
+            dialog.setLabelText(f"{label} ({elapsed:.1f} s)")
+            QApplication.processEvents()
+            if dialog.wasCanceled():
+                self.controller.cancel()
+
+        self.controller.set_progress_callback(on_progress)
+        self.query_running = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.query_running = False
+            self.controller.set_progress_callback(None)
+            dialog.close()
+            if self.lazy_load_pending:
+                self.lazy_load_pending = False
+                QTimer.singleShot(0, self.load_visible_lazy_cells)
 
     def clear_inputs(self):
         for input_field in self.inputs.values():
@@ -133,49 +252,85 @@ class TableManager(QWidget):
             QMessageBox.warning(self, "Error", "Incorrect input")
             return
 
-        records = self.controller.filter(order_by=attribute, order_direction=direction, **kwargs)
+        try:
+            records = self.run_with_progress(f"Filtering {self.controller.table_name}...", self.controller.filter,
+                                             order_by=attribute, order_direction=direction, **kwargs)
+        except QueryCancelledError:
+            QMessageBox.information(self, "Cancelled", "Filtering was cancelled.")
+            return
+        except QueryTimeoutError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
         self.update_table(records)
         QMessageBox.information(self, "Success", f"{self.controller.table_name} filtered successfully!")
 
     def edit_record(self):
-        selected_row = self.table.currentRow()
-        selected_col = self.table.currentColumn()
-        if selected_row == -1:
-            QMessageBox.warning(self, "Error", "Please select a record to edit.")
-            return
-        if selected_col == 0:
-            QMessageBox.warning(self, "Error", "You selected a primary key")
-            self.load_records()
-            return
-        if not self.controller.validate_edit_permission(selected_col):
-            QMessageBox.warning(self, "Error", "You don't have sufficient permissions to edit this cell")
-            self.load_records()
+        if not self.dirty_cells:
+            QMessageBox.warning(self, "Error", "There are no changes to save.")
             return
 
-        values = [self.table.item(selected_row, col).text() for col in range(self.table.columnCount())]
-        is_valid, error_text = self.controller.validate_record_types(values)
-        if not is_valid:
-            QMessageBox.warning(self, "Error", error_text)
+        for record_id, changes in self.dirty_cells.items():
+            is_valid, error_text = self.controller.validate_changes(record_id, changes)
+            if not is_valid:
+                QMessageBox.warning(self, "Error", f"{error_text} (record {record_id})")
+                return
+
+        try:
+            updated = self.controller.update_changes(self.dirty_cells)
+        except RecordNotFoundError as e:
+            QMessageBox.warning(self, "Error", f"{e}. Nothing was saved.")
             self.load_records()
             return
-
-        model = self.controller.get_model(*values)
-        self.controller.update(model)
+        if not updated:
+            QMessageBox.warning(self, "Error", "The people number is more than the remaining places of the tour")
+            return
+        self.dirty_cells = {}
         self.load_records()
         QMessageBox.information(self, "Success", f"{self.controller.table_name} updated successfully!")
 
+    def get_selected_ids(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()})
+        if not rows and self.table.currentRow() != -1:
+            rows = [self.table.currentRow()]
+        return [int(self.table.item(row, 0).text()) for row in rows]
+
     def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        record_ids = self.get_selected_ids()
+        if not record_ids:
             QMessageBox.warning(self, "Error", "Please select a record to delete.")
             return
 
-        record_id = self.table.item(selected_row, 0).text()
-        self.controller.delete(record_id)
+        try:
+            impact = self.run_with_progress("Counting dependent records...",
+                                            self.controller.get_delete_impact, record_ids)
+        except (QueryCancelledError, QueryTimeoutError) as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        question = f"Delete {len(record_ids)} {self.controller.table_name}?"
+        cascade = [f"{table_name}: {count}" for table_name, count in impact.items() if count]
+        if cascade:
+            question += "\nThis will also delete " + ", ".join(cascade)
+        answer = QMessageBox.question(self, "Confirm", question)
+        if answer != QMessageBox.Yes:
+            return
+
+        try:
+            self.run_with_progress(f"Deleting {self.controller.table_name}...", self.controller.delete_many, record_ids)
+        except QueryCancelledError:
+            QMessageBox.information(self, "Cancelled", "Deletion was cancelled, nothing was deleted.")
+            return
+        except QueryTimeoutError as e:
+            QMessageBox.warning(self, "Error", f"{e}. Nothing was deleted.")
+            return
+        for record_id in record_ids:
+            self.dirty_cells.pop(record_id, None)
 
         admin_interface = self.window()
+        affected = [self.controller.table_name, *[table_name for table_name, count in impact.items() if count]]
         if isinstance(admin_interface, AdminInterface):
-            admin_interface.load_all_tables()
+            admin_interface.load_tables(affected)
+        else:
+            self.load_records()
         QMessageBox.information(self, "Success", f"{self.controller.table_name} deleted successfully!")
 
 
@@ -205,13 +360,23 @@ class AdminInterface(QMainWindow):
         layout.addWidget(table_manager)
 
     def closeEvent(self, event):
+        busy = [table_manager for table_manager in self.findChildren(TableManager) if table_manager.query_running]
+        if busy:
+            # Closing the connections from inside a running statement's progress handler is not allowed
+            for table_manager in busy:
+                table_manager.controller.cancel()
+            event.ignore()
+            return
         for controller in self.controllers.values():
             controller.repo.close()
         event.accept()
 
     def load_all_tables(self):
+        self.load_tables(self.controllers.keys())
+
+    def load_tables(self, table_names):
         for index in range(self.tabs.count()):
             tab = self.tabs.widget(index)
             table_manager = tab.findChild(TableManager)
-            if table_manager:
+            if table_manager and table_manager.controller.table_name in table_names:
                 table_manager.load_records()
@@ -0,0 +1,135 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackupManager:
+    def __init__(self, db_path, backup_dir, pages_per_step=64, step_pause=0.005, duty_cycle=0.5, keep=5,
+                 latency_budget=0.02):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.duty_cycle = duty_cycle
+        self.keep = keep
+        self.latency_budget = latency_budget
+        self.busy_steps = 0
+        self.last_error = None
+        self.__timer_thread = None
+        self.__stop_event = threading.Event()
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+    def __throttle(self, step_time):
+        # Keeps the backup busy for at most duty_cycle of the wall time, so the app gets the disk the rest
+        pause = step_time * (1 - self.duty_cycle) / self.duty_cycle if self.duty_cycle < 1 else 0
+        time.sleep(max(self.step_pause, pause))
+
+    def __fit_step_to_budget(self, step_times):
+        # Keeps each burst of reads short enough that foreground queries only wait latency_budget for the disk
+        if not step_times or not self.latency_budget:
+            return
+        per_page = max(sum(step_times) / len(step_times) / self.pages_per_step, 1e-7)
+        self.pages_per_step = max(1, min(int(self.latency_budget / per_page), 4096))
+
+    def __open_source(self):
+        source = sqlite3.connect(self.db_path, isolation_level=None)
+        # In WAL mode readers never block writers, so the copy can hold one snapshot for its whole duration
+        mode = source.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if mode.lower() != "wal":
+            source.close()
+            raise sqlite3.OperationalError(f"Online backup needs WAL mode, {self.db_path} stays in {mode} mode")
+        return source
+
+    def __copy(self, target_path, progress):
+        source = self.__open_source()
+        target = sqlite3.connect(target_path)
+        step_times = []
+        step_started = time.perf_counter()
+
+        def on_step(status, remaining, total):
+            nonlocal step_started
+            if status in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+                # Nothing was copied, sqlite3 sleeps for step_pause and retries the same step
+                self.busy_steps += 1
+                step_started = time.perf_counter()
+                return
+            step_times.append(time.perf_counter() - step_started)
+            if progress:
+                progress(total - remaining, total)
+            if remaining:
+                self.__throttle(step_times[-1])
+            step_started = time.perf_counter()
+
+        try:
+            # The read transaction pins a snapshot: commits from other connections go to the WAL
+            # and neither wait for the copy nor make SQLite restart it
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchall()
+            source.backup(target, pages=self.pages_per_step, progress=on_step, sleep=self.step_pause)
+            source.execute("COMMIT")
+            # A snapshot is a single self-contained file, without -wal and -shm companions
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            source.close()
+            self.__fit_step_to_budget(step_times)
+
+    def backup(self, target_path=None, progress=None):
+        if not target_path:
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            target_path = os.path.join(self.backup_dir, f"snapshot_{stamp}.db")
+        self.__copy(target_path, progress)
+        self.rotate()
+        return target_path
+
+    def list_snapshots(self):
+        names = [name for name in os.listdir(self.backup_dir)
+                 if name.startswith("snapshot_") and name.endswith(".db")]
+        return [os.path.join(self.backup_dir, name) for name in sorted(names)]
+
+    def rotate(self):
+        snapshots = self.list_snapshots()
+        for path in snapshots[:max(len(snapshots) - self.keep, 0)]:
+            os.remove(path)
+
+    def open_snapshot(self, snapshot_path=None):
+        if not snapshot_path:
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                return None
+            snapshot_path = snapshots[-1]
+        return sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+
+    def start_schedule(self, interval_seconds):
+        if self.__timer_thread and self.__timer_thread.is_alive():
+            return
+        self.__stop_event.clear()
+
+        def loop():
+            while not self.__stop_event.wait(interval_seconds):
+                try:
+                    self.backup()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = e
+                    logger.exception("Scheduled backup of %s failed", self.db_path)
+
+        self.__timer_thread = threading.Thread(target=loop, daemon=True)
+        self.__timer_thread.start()
+
+    def stop_schedule(self):
+        self.__stop_event.set()
+        if self.__timer_thread:
+            self.__timer_thread.join()
+            self.__timer_thread = None
+
+
+if __name__ == '__main__':
+    manager = BackupManager("../databases/TravelAgency.db", "../databases/backups")
+    print(manager.backup(progress=lambda done, total: print(f"{done}/{total} pages")))
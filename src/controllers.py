@@ -62,12 +62,20 @@ class ValidateRegEx:
 
 
 class BaseController:
+    model_class = None
+    lazy_columns = ()
+
     def __init__(self, table_name, repo):
         self.table_name = table_name
         self.repo = repo
         self.validation = ValidateRegEx
-        self.attr_types = self.repo.get_attr_types(self.table_name)
-        self.attr_names = self.repo.get_attr_names(self.table_name)
+        self.refresh_schema()
+
+    def refresh_schema(self):
+        # Columns the model does not know yet (e.g. just added by a migration) stay hidden
+        table_types = dict(zip(self.repo.get_attr_names(self.table_name), self.repo.get_attr_types(self.table_name)))
+        self.attr_names = [name for name in self.model_class.columns if name in table_types]
+        self.attr_types = [table_types[name] for name in self.attr_names]
 
     def get_attr_names(self):
         return self.attr_names
@@ -78,42 +86,90 @@ class BaseController:
     def get_columns_count(self):
         return len(self.attr_names)
 
+    def get_lazy_columns(self):
+        return self.lazy_columns
+
+    def get_eager_columns(self):
+        return [name for name in self.attr_names if name not in self.lazy_columns]
+
+    def get_model_from_projection(self, columns, row):
+        values = dict(zip(columns, row))
+        return self.get_model(*[values.get(name) for name in self.attr_names])
+
     def get_all(self):
-        return self.repo.fetch_all()
+        if not self.lazy_columns:
+            return self.repo.fetch_all()
+        columns = self.get_eager_columns()
+        rows = self.repo.fetch_projection(self.table_name, columns)
+        return [self.get_model_from_projection(columns, row) for row in rows]
+
+    def get_column_values(self, column, model_ids):
+        return self.repo.fetch_column_by_ids(self.table_name, self.attr_names[0], column, model_ids)
 
     def get_by_id(self, model_id):
         return self.repo.fetch_by_id(model_id)
 
     def add(self, model):
         self.repo.insert(model)
+        return True
 
     def update(self, model):
         self.repo.update(model)
 
+    def update_changes(self, changes_by_id):
+        named_changes = {}
+        for model_id, changes in changes_by_id.items():
+            named_changes[model_id] = {self.attr_names[col]: text for col, text in changes.items()}
+        return self.repo.update_columns(self.table_name, self.attr_names[0], named_changes)
+
     def delete(self, model_id):
         self.repo.delete(model_id)
 
+    def delete_many(self, model_ids):
+        self.repo.delete_by_ids(self.table_name, self.attr_names[0], model_ids)
+
+    def get_delete_impact(self, model_ids):
+        return self.repo.count_cascade(self.table_name, self.attr_names[0], model_ids)
+
     def filter(self, order_by=None, order_direction="ASC", **kwargs):
         if not order_by:
             order_by = self.get_attr_names()[0]
-        if not kwargs:
-            return self.repo.filter_by(self.table_name, Client, order_by, order_direction)
-        return self.repo.filter_by(self.table_name, self.get_model, order_by, order_direction, **kwargs)
+        columns = self.get_eager_columns()
+        return self.repo.filter_by(self.table_name, lambda *row: self.get_model_from_projection(columns, row),
+                                   order_by, order_direction, columns, **kwargs)
 
     def validate_filter(self, condition, attribute, direction):
         return self.validation.validate_filter_data(condition, attribute, self.attr_names, direction)
 
+    def set_progress_callback(self, callback):
+        self.repo.set_progress_callback(callback)
+
+    def cancel(self):
+        self.repo.cancel()
+
     def get_model(self, *args):
         raise NotImplementedError("Subclasses must implement this method")
 
+    def is_invalid_type(self, text, column):
+        raise NotImplementedError("Subclasses must implement this method")
+
     def validate_record_types(self, record):
         raise NotImplementedError("Subclasses must implement this method")
 
+    def validate_changes(self, model_id, changes):
+        for col, text in changes.items():
+            if self.is_invalid_type(text, col):
+                return False, "Invalid type of " + self.attr_names[col]
+        return True, "All good"
+
     def validate_edit_permission(self, selected_col):
         raise NotImplementedError("Subclasses must implement this method")
 
 
 class ClientController(BaseController):
+    model_class = Client
+    lazy_columns = ("address",)
+
     def __init__(self, client_repo):
         super().__init__("clients", client_repo)
 
@@ -141,6 +197,8 @@ class ClientController(BaseController):
 
 
 class TourController(BaseController):
+    model_class = Tour
+
     def __init__(self, tour_repo):
         super().__init__("tours", tour_repo)
 
@@ -160,6 +218,19 @@ class TourController(BaseController):
                 return False, "Invalid type of " + self.attr_names[col]
         return True, "All good"
 
+    def search_available(self, min_free_places=1, departure=None, destination=None, start_from=None,
+                         start_to=None, after=None, page_size=50):
+        for date in (start_from, start_to):
+            if date and not self.validation.is_date(date):
+                raise ValueError(f"Invalid date: {date}")
+        results = self.repo.search_available(int(min_free_places), departure, destination, start_from, start_to,
+                                             after, page_size)
+        next_page = None
+        if len(results) == page_size:
+            last_tour = results[-1][0]
+            next_page = (last_tour.start_date, last_tour.tour_id)
+        return results, next_page
+
     def validate_edit_permission(self, selected_col):
         current_col_name = self.attr_names[selected_col]
         if current_col_name == "price" or current_col_name == "available_place":
@@ -168,12 +239,17 @@ class TourController(BaseController):
 
 
 class BookingController(BaseController):
+    model_class = Booking
+
     def __init__(self, booking_repo):
         super().__init__("bookings", booking_repo)
 
     def get_model(self, *args):
         return Booking(*args)
 
+    def add(self, model):
+        return self.repo.reserve_seats(model)
+
     def calculate_total_price(self, booking):
         return self.repo.fetch_price_by_tour_id(booking.tour_id) * int(booking.people_number)
 
@@ -207,6 +283,26 @@ class BookingController(BaseController):
                 return False, "The people number is more than the remaining places of the tour"
         return True, "All good"
 
+    def validate_changes(self, model_id, changes):
+        is_valid, error_text = super().validate_changes(model_id, changes)
+        tour_col = self.attr_names.index("tour_id")
+        status_col = self.attr_names.index("status")
+        if not is_valid or (tour_col not in changes and status_col not in changes):
+            return is_valid, error_text
+        booking = self.repo.fetch_by_id(model_id)
+        if booking is None:
+            return False, f"Record {model_id} no longer exists"
+        was_active = booking.status in ("confirmed", "pending")
+        old_tour_id = booking.tour_id
+        booking.tour_id = int(changes.get(tour_col, booking.tour_id))
+        booking.status = changes.get(status_col, booking.status)
+        if tour_col in changes and int(booking.total_price) != self.calculate_total_price(booking):
+            return False, "Incorrect total_price."
+        becomes_active = booking.status in ("confirmed", "pending") and (not was_active or booking.tour_id != old_tour_id)
+        if becomes_active and int(booking.people_number) > self.calculate_remaining_places(booking.tour_id):
+            return False, "The people number is more than the remaining places of the tour"
+        return True, "All good"
+
     def validate_edit_permission(self, selected_col):
         current_col_name = self.attr_names[selected_col]
         if current_col_name == "people_number" or current_col_name == "total_price":
@@ -215,6 +311,8 @@ class BookingController(BaseController):
 
 
 class PaymentController(BaseController):
+    model_class = Payment
+
     def __init__(self, payment_repo):
         super().__init__("payments", payment_repo)
 
@@ -243,6 +341,18 @@ class PaymentController(BaseController):
                 return False, "Incorrect amount."
         return True, "All good"
 
+    def validate_changes(self, model_id, changes):
+        is_valid, error_text = super().validate_changes(model_id, changes)
+        if not is_valid or self.attr_names.index("booking_id") not in changes:
+            return is_valid, error_text
+        payment = self.repo.fetch_by_id(model_id)
+        if payment is None:
+            return False, f"Record {model_id} no longer exists"
+        payment.booking_id = int(changes[self.attr_names.index("booking_id")])
+        if int(payment.amount) != self.get_right_amount(payment):
+            return False, "Incorrect amount."
+        return True, "All good"
+
     def validate_edit_permission(self, selected_col):
         current_col_name = self.attr_names[selected_col]
         if current_col_name == "amount":
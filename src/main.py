@@ -1,16 +1,19 @@
+import os
 import sys
 from PySide6.QtWidgets import QApplication
 from repositories import ClientRepository, TourRepository, BookingRepository, PaymentRepository
 from controllers import ClientController, TourController, BookingController, PaymentController
 from GeniusInterface import AdminInterface
+from workload import WorkloadRecorder, RecordingController
 
 
 if __name__ == "__main__":
     db_path = "../databases/TravelAgency.db"
-    client_repo = ClientRepository(db_path)
-    tour_repo = TourRepository(db_path)
-    booking_repo = BookingRepository(db_path)
-    payment_repo = PaymentRepository(db_path)
+    query_time_budget = 30
+    client_repo = ClientRepository(db_path, query_time_budget)
+    tour_repo = TourRepository(db_path, query_time_budget)
+    booking_repo = BookingRepository(db_path, query_time_budget)
+    payment_repo = PaymentRepository(db_path, query_time_budget)
 
     my_controllers = {
         "clients": ClientController(client_repo),
@@ -19,6 +22,11 @@ if __name__ == "__main__":
         "payments": PaymentController(payment_repo)
     }
 
+    capture_path = os.environ.get("WORKLOAD_CAPTURE")
+    if capture_path:
+        recorder = WorkloadRecorder(capture_path)
+        my_controllers = {name: RecordingController(controller, recorder) for name, controller in my_controllers.items()}
+
     app = QApplication(sys.argv)
     window = AdminInterface(my_controllers)
     window.show()
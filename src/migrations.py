@@ -0,0 +1,237 @@
+import sqlite3
+import time
+
+
+class Migration:
+    def __init__(self, version, description, table_name=None, create_sql=None, column_map=None, statements=()):
+        self.version = version
+        self.description = description
+        self.table_name = table_name
+        self.create_sql = create_sql
+        self.column_map = column_map
+        self.statements = statements
+
+
+class MigrationEngine:
+    def __init__(self, db_path, batch_size=1000, pause=0.0, progress=None):
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        self.cursor = self.conn.cursor()
+        self.cursor.execute('PRAGMA foreign_keys = ON')
+        self.batch_size = batch_size
+        self.pause = pause
+        self.progress = progress
+
+    def close(self):
+        self.conn.close()
+
+    def get_version(self):
+        self.cursor.execute("PRAGMA user_version")
+        return self.cursor.fetchone()[0]
+
+    def get_pending(self, migrations):
+        current = self.get_version()
+        return sorted((m for m in migrations if m.version > current), key=lambda m: m.version)
+
+    def migrate(self, migrations, controllers=()):
+        applied = []
+        for migration in self.get_pending(migrations):
+            if migration.create_sql:
+                self.__rebuild_table(migration)
+            self.__begin()
+            try:
+                for statement in migration.statements:
+                    self.cursor.execute(statement)
+                self.cursor.execute(f"PRAGMA user_version = {int(migration.version)}")
+                self.cursor.execute("COMMIT")
+            except sqlite3.Error:
+                self.cursor.execute("ROLLBACK")
+                raise
+            applied.append(migration)
+            for controller in controllers:
+                if migration.table_name in (None, controller.table_name):
+                    controller.refresh_schema()
+        return applied
+
+    def __begin(self, retries=8, backoff=0.01):
+        for attempt in range(retries):
+            try:
+                self.cursor.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+        raise sqlite3.OperationalError("database is locked: migration could not start a transaction")
+
+    def __get_columns(self, table_name):
+        self.cursor.execute(f'PRAGMA table_info("{table_name}")')
+        return [row[1] for row in self.cursor.fetchall()]
+
+    def __get_primary_key(self, table_name):
+        self.cursor.execute(f'PRAGMA table_info("{table_name}")')
+        return next(row[1] for row in self.cursor.fetchall() if row[5] == 1)
+
+    def __report(self, table_name, copied, total, started):
+        if self.progress:
+            elapsed = time.perf_counter() - started
+            self.progress(table_name, copied, total, copied / elapsed if elapsed else 0.0)
+
+    def __create_triggers(self, table_name, shadow_name, pk, column_map):
+        targets = ", ".join(column_map)
+        new_values = ", ".join(f"NEW.{source}" for source in column_map.values())
+        self.cursor.execute(f"""
+        CREATE TRIGGER _migrate_{table_name}_insert AFTER INSERT ON {table_name} BEGIN
+            DELETE FROM {shadow_name} WHERE {pk} = NEW.{pk};
+            INSERT INTO {shadow_name} ({targets}) VALUES ({new_values});
+        END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER _migrate_{table_name}_update AFTER UPDATE ON {table_name} BEGIN
+            DELETE FROM {shadow_name} WHERE {pk} = OLD.{pk};
+            DELETE FROM {shadow_name} WHERE {pk} = NEW.{pk};
+            INSERT INTO {shadow_name} ({targets}) VALUES ({new_values});
+        END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER _migrate_{table_name}_delete AFTER DELETE ON {table_name} BEGIN
+            DELETE FROM {shadow_name} WHERE {pk} = OLD.{pk};
+        END
+        """)
+
+    def __drop_triggers(self, table_name):
+        for action in ("insert", "update", "delete"):
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS _migrate_{table_name}_{action}")
+
+    def __get_dependent_sql(self, table_name):
+        self.cursor.execute("""
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+            AND substr(name, 1, 9) != '_migrate_'
+        """, (table_name,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def __rebuild_table(self, migration):
+        table_name = migration.table_name
+        shadow_name = f"_new_{table_name}"
+        try:
+            self.__copy_to_shadow(migration, table_name, shadow_name)
+        except Exception:
+            # Leave the live table exactly as it was, without capture triggers or a half-filled shadow table
+            if self.conn.in_transaction:
+                self.cursor.execute("ROLLBACK")
+            self.__drop_triggers(table_name)
+            self.cursor.execute(f"DROP TABLE IF EXISTS {shadow_name}")
+            raise
+
+    def __copy_to_shadow(self, migration, table_name, shadow_name):
+        pk = self.__get_primary_key(table_name)
+        dependent_sql = self.__get_dependent_sql(table_name)
+
+        self.cursor.execute(f"DROP TABLE IF EXISTS {shadow_name}")
+        self.__drop_triggers(table_name)
+        self.cursor.execute(migration.create_sql.format(table_name=shadow_name))
+        column_map = migration.column_map
+        if not column_map:
+            old_columns = self.__get_columns(table_name)
+            column_map = {column: column for column in self.__get_columns(shadow_name) if column in old_columns}
+
+        self.__create_triggers(table_name, shadow_name, pk, column_map)
+
+        targets = ", ".join(column_map)
+        sources = ", ".join(column_map.values())
+        self.cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+        total = self.cursor.fetchone()[0]
+        # Rows written after this point reach the shadow table through the triggers
+        self.cursor.execute(f"SELECT COALESCE(MIN({pk}), 0) - 1, COALESCE(MAX({pk}), 0) FROM {table_name}")
+        last_id, max_id = self.cursor.fetchone()
+        copied = 0
+        started = time.perf_counter()
+        while True:
+            self.__begin()
+            self.cursor.execute(f"SELECT MAX({pk}), COUNT(*) FROM "
+                                f"(SELECT {pk} FROM {table_name} WHERE {pk} > ? AND {pk} <= ? ORDER BY {pk} LIMIT ?)",
+                                (last_id, max_id, self.batch_size))
+            batch_last_id, batch_count = self.cursor.fetchone()
+            if batch_count:
+                # Only rows already captured by the triggers are skipped, any other constraint failure aborts
+                self.cursor.execute(f"INSERT INTO {shadow_name} ({targets}) "
+                                    f"SELECT {sources} FROM {table_name} WHERE {pk} > ? AND {pk} <= ? "
+                                    f"ON CONFLICT({pk}) DO NOTHING",
+                                    (last_id, batch_last_id))
+            self.cursor.execute("COMMIT")
+            if not batch_count:
+                break
+            copied += batch_count
+            last_id = batch_last_id
+            self.__report(table_name, copied, total, started)
+            if self.pause:
+                time.sleep(self.pause)
+
+        # Swap with foreign keys off so dropping the old table neither cascades nor breaks child references
+        self.cursor.execute("PRAGMA foreign_keys = OFF")
+        self.__begin()
+        try:
+            self.__drop_triggers(table_name)
+            self.cursor.execute(f"DROP TABLE {table_name}")
+            self.cursor.execute(f"ALTER TABLE {shadow_name} RENAME TO {table_name}")
+            for statement in dependent_sql:
+                self.cursor.execute(statement)
+            self.cursor.execute("PRAGMA foreign_key_check")
+            if self.cursor.fetchall():
+                raise sqlite3.IntegrityError(f"Foreign key violations after migrating {table_name}")
+            self.cursor.execute("COMMIT")
+        except sqlite3.Error:
+            self.cursor.execute("ROLLBACK")
+            raise
+        finally:
+            self.cursor.execute("PRAGMA foreign_keys = ON")
+        self.__report(table_name, copied, total, started)
+
+
+MIGRATIONS = [
+    Migration(1, "Index bookings by tour and status for remaining places lookups", statements=(
+        "CREATE INDEX IF NOT EXISTS idx_bookings_tour_status ON bookings (tour_id, status)",
+    )),
+    Migration(2, "Index payments by booking for reconciliation joins", statements=(
+        "CREATE INDEX IF NOT EXISTS idx_payments_booking_id ON payments (booking_id)",
+    )),
+    Migration(3, "Index tours and bookings for availability search", statements=(
+        "CREATE INDEX IF NOT EXISTS idx_tours_departure_start ON tours (city_of_departure, start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_tours_destination_start ON tours (destination, start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_tours_start_date ON tours (start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_tour_status_people ON bookings (tour_id, status, people_number)",
+        "DROP INDEX IF EXISTS idx_bookings_tour_status",
+    )),
+    Migration(4, "Never reuse booking ids, archived bookings keep theirs", "bookings", """
+    CREATE TABLE {table_name} (
+        booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id INTEGER NOT NULL,
+        tour_id INTEGER NOT NULL,
+        booking_date DATE NOT NULL,
+        people_number INTEGER NOT NULL,
+        total_price INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        CONSTRAINT fk_client FOREIGN KEY (client_id) REFERENCES clients(client_id) ON DELETE CASCADE,
+        CONSTRAINT fk_tour FOREIGN KEY (tour_id) REFERENCES tours(tour_id) ON DELETE CASCADE,
+        CONSTRAINT chk_status CHECK (status IN ('pending', 'confirmed', 'cancelled', 'completed'))
+    )
+    """),
+    Migration(5, "Never reuse payment ids, archived payments keep theirs", "payments", """
+    CREATE TABLE {table_name} (
+        payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        booking_id INTEGER NOT NULL,
+        payment_date DATE NOT NULL,
+        amount INTEGER NOT NULL,
+        payment_method TEXT NOT NULL DEFAULT 'credit_card',
+        CONSTRAINT fk_booking FOREIGN KEY (booking_id) REFERENCES bookings(booking_id) ON DELETE CASCADE
+    )
+    """),
+]
+
+
+if __name__ == '__main__':
+    engine = MigrationEngine("../databases/TravelAgency.db",
+                             progress=lambda table, done, total, rate: print(f"{table}: {done}/{total} ({rate:.0f} rows/s)"))
+    for applied in engine.migrate(MIGRATIONS):
+        print(f"Applied {applied.version}: {applied.description}")
+    engine.close()
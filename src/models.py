@@ -1,4 +1,6 @@
 class Client:
+    columns = ("client_id", "name", "email", "phone", "address", "date_of_birth")
+
     def __init__(self, client_id, name, email, phone, address, date_of_birth):
         self.client_id = client_id
         self.name = name
@@ -9,6 +11,8 @@ class Client:
 
 
 class Tour:
+    columns = ("tour_id", "title", "city_of_departure", "destination", "start_date", "end_date", "price", "available_place")
+
     def __init__(self, tour_id, title, city_of_departure, destination, start_date, end_date, price, available_place):
         self.tour_id = tour_id
         self.title = title
@@ -21,6 +25,8 @@ class Tour:
 
 
 class Booking:
+    columns = ("booking_id", "client_id", "tour_id", "booking_date", "people_number", "total_price", "status")
+
     def __init__(self, booking_id, client_id, tour_id, booking_date, people_number, total_price, status):
         self.booking_id = booking_id
         self.client_id = client_id
@@ -32,6 +38,8 @@ class Booking:
 
 
 class Payment:
+    columns = ("payment_id", "booking_id", "payment_date", "amount", "payment_method")
+
     def __init__(self, payment_id, booking_id, payment_date, amount, payment_method):
         self.payment_id = payment_id
         self.booking_id = booking_id
@@ -0,0 +1,127 @@
+import csv
+import json
+import os
+import sqlite3
+import sys
+from multiprocessing import Pool
+
+
+REPORT_HEADER = ["booking_id", "status", "total_price", "paid", "payments_count", "mismatch"]
+
+
+def classify(total_price, paid):
+    if paid == 0:
+        return "unpaid"
+    if paid < total_price:
+        return "underpaid"
+    return "overpaid"
+
+
+def reconcile_chunk(args):
+    db_path, low_id, high_id = args
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    cursor = conn.cursor()
+    cursor.execute("""
+    SELECT b.booking_id, b.status, b.total_price, COALESCE(SUM(p.amount), 0) AS paid, COUNT(p.payment_id)
+    FROM bookings b LEFT JOIN payments p ON p.booking_id = b.booking_id
+    WHERE b.booking_id > ? AND b.booking_id <= ?
+    GROUP BY b.booking_id
+    HAVING paid != b.total_price
+    ORDER BY b.booking_id
+    """, (low_id, high_id))
+    rows = cursor.fetchall()
+    conn.close()
+    mismatches = []
+    for booking_id, status, total_price, paid, payments_count in rows:
+        if status == "cancelled" and paid == 0:
+            continue
+        mismatches.append([booking_id, status, total_price, paid, payments_count, classify(total_price, paid)])
+    return high_id, mismatches
+
+
+class ReconciliationJob:
+    def __init__(self, db_path, report_path, checkpoint_path=None, chunk_size=10000, workers=1):
+        self.db_path = db_path
+        self.report_path = report_path
+        self.checkpoint_path = checkpoint_path or report_path + ".checkpoint"
+        self.chunk_size = chunk_size
+        self.workers = workers
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {"last_booking_id": 0, "report_size": 0, "mismatches": 0, "complete": False}
+        with open(self.checkpoint_path) as file:
+            return json.load(file)
+
+    def save_checkpoint(self, checkpoint):
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(checkpoint, file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def reset(self):
+        for path in (self.report_path, self.checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def iter_chunks(self, last_booking_id):
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        cursor = conn.cursor()
+        while True:
+            cursor.execute("""
+            SELECT MAX(booking_id) FROM (
+                SELECT booking_id FROM bookings WHERE booking_id > ? ORDER BY booking_id LIMIT ?
+            )
+            """, (last_booking_id, self.chunk_size))
+            high_id = cursor.fetchone()[0]
+            if high_id is None:
+                break
+            yield self.db_path, last_booking_id, high_id
+            last_booking_id = high_id
+        conn.close()
+
+    def run(self, progress=None):
+        checkpoint = self.load_checkpoint()
+        # Only an interrupted run is resumed, a finished one is redone from scratch
+        if checkpoint.get("complete"):
+            self.reset()
+            checkpoint = self.load_checkpoint()
+        # Drop rows written after the last checkpoint, they are recomputed below
+        with open(self.report_path, "a+") as report:
+            report.truncate(checkpoint["report_size"])
+
+        with open(self.report_path, "a", newline="") as report:
+            writer = csv.writer(report)
+            if checkpoint["report_size"] == 0:
+                writer.writerow(REPORT_HEADER)
+
+            chunks = self.iter_chunks(checkpoint["last_booking_id"])
+            pool = Pool(self.workers) if self.workers > 1 else None
+            try:
+                results = pool.imap(reconcile_chunk, chunks) if pool else map(reconcile_chunk, chunks)
+                for high_id, mismatches in results:
+                    writer.writerows(mismatches)
+                    report.flush()
+                    checkpoint = {
+                        "last_booking_id": high_id,
+                        "report_size": report.tell(),
+                        "mismatches": checkpoint["mismatches"] + len(mismatches),
+                        "complete": False,
+                    }
+                    self.save_checkpoint(checkpoint)
+                    if progress:
+                        progress(high_id, checkpoint["mismatches"])
+            finally:
+                if pool:
+                    pool.terminate()
+                    pool.join()
+            checkpoint["report_size"] = report.tell()
+            checkpoint["complete"] = True
+            self.save_checkpoint(checkpoint)
+        return checkpoint["mismatches"]
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    job = ReconciliationJob("../databases/TravelAgency.db", "../databases/reconciliation.csv", workers=workers)
+    print(f"Mismatches found: {job.run(progress=lambda booking_id, found: print(f'up to {booking_id}: {found}'))}")
@@ -1,12 +1,28 @@
 import sqlite3
+import time
 from models import Client, Tour, Booking, Payment
 
 
+class QueryTimeoutError(sqlite3.OperationalError):
+    pass
+
+
+class QueryCancelledError(sqlite3.OperationalError):
+    pass
+
+
+class RecordNotFoundError(sqlite3.DatabaseError):
+    pass
+
+
 class BaseRepository:
-    def __init__(self, db_path):
+    def __init__(self, db_path, time_budget=None):
         self.conn = sqlite3.connect(db_path)
         self.cursor = self.conn.cursor()
         self.cursor.execute('PRAGMA foreign_keys = ON')
+        self.time_budget = time_budget
+        self.progress_callback = None
+        self.__cancel_requested = False
 
     def commit(self):
         self.conn.commit()
@@ -14,6 +30,125 @@ class BaseRepository:
     def close(self):
         self.conn.close()
 
+    def set_time_budget(self, seconds):
+        self.time_budget = seconds
+
+    def set_progress_callback(self, callback):
+        self.progress_callback = callback
+
+    def cancel(self):
+        self.__cancel_requested = True
+
+    def execute_guarded(self, query, params=(), progress_steps=10000):
+        self.__cancel_requested = False
+        started = time.perf_counter()
+
+        def on_progress():
+            elapsed = time.perf_counter() - started
+            if self.progress_callback:
+                self.progress_callback(elapsed, self.time_budget)
+            if self.__cancel_requested:
+                return 1
+            return 1 if self.time_budget is not None and elapsed > self.time_budget else 0
+
+        self.conn.set_progress_handler(on_progress, progress_steps)
+        try:
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            if "interrupted" not in str(e):
+                raise
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            if self.__cancel_requested:
+                raise QueryCancelledError("The query was cancelled")
+            raise QueryTimeoutError(f"The query took longer than {self.time_budget} seconds and was stopped")
+        finally:
+            self.conn.set_progress_handler(None, 0)
+
+    def attach_archive(self, archive_path):
+        self.cursor.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archive.bookings (
+            booking_id INTEGER PRIMARY KEY,
+            client_id INTEGER NOT NULL,
+            tour_id INTEGER NOT NULL,
+            booking_date DATE NOT NULL,
+            people_number INTEGER NOT NULL,
+            total_price INTEGER NOT NULL,
+            status TEXT NOT NULL
+        )
+        """)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archive.payments (
+            payment_id INTEGER PRIMARY KEY,
+            booking_id INTEGER NOT NULL,
+            payment_date DATE NOT NULL,
+            amount INTEGER NOT NULL,
+            payment_method TEXT NOT NULL DEFAULT 'credit_card',
+            CONSTRAINT fk_booking FOREIGN KEY (booking_id) REFERENCES bookings(booking_id) ON DELETE CASCADE
+        )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_payments_booking_id ON payments (booking_id)")
+        self.cursor.execute(f"""
+        CREATE TEMP VIEW IF NOT EXISTS bookings_history AS
+        SELECT {", ".join(Booking.columns)} FROM main.bookings
+        UNION ALL SELECT {", ".join(Booking.columns)} FROM archive.bookings
+        """)
+        self.cursor.execute(f"""
+        CREATE TEMP VIEW IF NOT EXISTS payments_history AS
+        SELECT {", ".join(Payment.columns)} FROM main.payments
+        UNION ALL SELECT {", ".join(Payment.columns)} FROM archive.payments
+        """)
+        self.commit()
+
+    def update_columns(self, table_name, id_name, changes_by_id):
+        try:
+            for record_id, changes in changes_by_id.items():
+                assignments = ", ".join(f"{column}=?" for column in changes)
+                self.cursor.execute(f"UPDATE {table_name} SET {assignments} WHERE {id_name}=?",
+                                    (*changes.values(), record_id))
+                if self.cursor.rowcount != 1:
+                    raise RecordNotFoundError(f"Record {record_id} no longer exists in {table_name}")
+            self.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return True
+
+    def delete_by_ids(self, table_name, id_name, ids):
+        placeholders = ", ".join("?" * len(ids))
+        try:
+            self.execute_guarded(f"DELETE FROM {table_name} WHERE {id_name} IN ({placeholders})", list(ids))
+            self.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def __get_cascade_children(self, table_name):
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+        tables = [row[0] for row in self.cursor.fetchall()]
+        children = []
+        for child in tables:
+            self.cursor.execute(f'PRAGMA foreign_key_list("{child}")')
+            for row in self.cursor.fetchall():
+                if row[2] == table_name and row[6] == "CASCADE":
+                    children.append((child, row[3], row[4] or "rowid"))
+        return children
+
+    def count_cascade(self, table_name, id_name, ids):
+        placeholders = ", ".join("?" * len(ids))
+        impact = {}
+        pending = [(table_name, f"{id_name} IN ({placeholders})")]
+        while pending:
+            parent, condition = pending.pop()
+            for child, from_column, to_column in self.__get_cascade_children(parent):
+                child_condition = f"{from_column} IN (SELECT {to_column} FROM {parent} WHERE {condition})"
+                rows = self.execute_guarded(f"SELECT COUNT(*) FROM {child} WHERE {child_condition}", list(ids))
+                impact[child] = impact.get(child, 0) + rows[0][0]
+                pending.append((child, child_condition))
+        return impact
+
     def get_attr_names(self, table_name):
         self.cursor.execute(f'PRAGMA table_info("{table_name}")')
         rows = self.cursor.fetchall()
@@ -51,8 +186,18 @@ class BaseRepository:
                 query += ", "
         return query
 
-    def filter_by(self, table_name, model_class, order_by, order_direction, **kwargs):
-        query = f"SELECT * FROM {table_name}"
+    def fetch_projection(self, table_name, columns):
+        self.cursor.execute(f"SELECT {', '.join(columns)} FROM {table_name}")
+        return self.cursor.fetchall()
+
+    def fetch_column_by_ids(self, table_name, id_name, column, ids):
+        placeholders = ", ".join("?" * len(ids))
+        self.cursor.execute(f"SELECT {id_name}, {column} FROM {table_name} WHERE {id_name} IN ({placeholders})",
+                            list(ids))
+        return dict(self.cursor.fetchall())
+
+    def filter_by(self, table_name, model_class, order_by, order_direction, columns=None, **kwargs):
+        query = f"SELECT {', '.join(columns) if columns else '*'} FROM {table_name}"
         params = None
         if kwargs:
             cond_query, params = self.__get_condition(**kwargs)
@@ -62,22 +207,21 @@ class BaseRepository:
             query += self.__get_order_by_part_query(order_by, order_direction)
 
         print(query)
-        self.cursor.execute(query, params if params else ())
-        rows = self.cursor.fetchall()
+        rows = self.execute_guarded(query, params if params else ())
         return [model_class(*row) for row in rows]
 
 
 class ClientRepository(BaseRepository):
-    def __init__(self, db_path):
-        super().__init__(db_path)
+    def __init__(self, db_path, time_budget=None):
+        super().__init__(db_path, time_budget)
 
     def fetch_all(self):
-        self.cursor.execute("SELECT * FROM clients")
+        self.cursor.execute(f"SELECT {', '.join(Client.columns)} FROM clients")
         rows = self.cursor.fetchall()
         return [Client(*row) for row in rows]
 
     def fetch_by_id(self, client_id):
-        self.cursor.execute("SELECT * FROM clients WHERE client_id=?", (client_id,))
+        self.cursor.execute(f"SELECT {', '.join(Client.columns)} FROM clients WHERE client_id=?", (client_id,))
         row = self.cursor.fetchone()
         return Client(*row) if row else None
 
@@ -97,24 +241,61 @@ class ClientRepository(BaseRepository):
         self.commit()
 
     def delete(self, client_id):
-        self.cursor.execute("DELETE FROM clients WHERE client_id=?", (client_id,))
+        self.execute_guarded("DELETE FROM clients WHERE client_id=?", (client_id,))
         self.commit()
 
 
 class TourRepository(BaseRepository):
-    def __init__(self, db_path):
-        super().__init__(db_path)
+    def __init__(self, db_path, time_budget=None):
+        super().__init__(db_path, time_budget)
 
     def fetch_all(self):
-        self.cursor.execute("SELECT * FROM tours")
+        self.cursor.execute(f"SELECT {', '.join(Tour.columns)} FROM tours")
         rows = self.cursor.fetchall()
         return [Tour(*row) for row in rows]
 
     def fetch_by_id(self, tour_id):
-        self.cursor.execute("SELECT * FROM tours WHERE tour_id=?", (tour_id,))
+        self.cursor.execute(f"SELECT {', '.join(Tour.columns)} FROM tours WHERE tour_id=?", (tour_id,))
         row = self.cursor.fetchone()
         return Tour(*row) if row else None
 
+    def search_available(self, min_free_places=1, departure=None, destination=None, start_from=None,
+                         start_to=None, after=None, limit=50):
+        conditions = ["t.available_place >= ?"]
+        params = [min_free_places]
+        if departure:
+            conditions.append("t.city_of_departure = ?")
+            params.append(departure)
+        if destination:
+            conditions.append("t.destination = ?")
+            params.append(destination)
+        if start_from:
+            conditions.append("t.start_date >= ?")
+            params.append(start_from)
+        if start_to:
+            conditions.append("t.start_date <= ?")
+            params.append(start_to)
+        if after:
+            conditions.append("(t.start_date, t.tour_id) > (?, ?)")
+            params.extend(after)
+
+        query = f"""
+        SELECT * FROM (
+            SELECT t.tour_id, t.title, t.city_of_departure, t.destination, t.start_date, t.end_date, t.price,
+                   t.available_place, t.available_place - COALESCE((
+                       SELECT SUM(b.people_number) FROM bookings b
+                       WHERE b.tour_id = t.tour_id AND b.status IN ('confirmed', 'pending')
+                   ), 0) AS free_places
+            FROM tours t
+            WHERE {" AND ".join(conditions)}
+        )
+        WHERE free_places >= ?
+        ORDER BY start_date, tour_id
+        LIMIT ?
+        """
+        rows = self.execute_guarded(query, (*params, min_free_places, limit))
+        return [(Tour(*row[:-1]), row[-1]) for row in rows]
+
     def insert(self, tour):
         self.cursor.execute("""
         INSERT INTO tours (title, city_of_departure, destination, start_date, end_date, price, available_place)
@@ -131,47 +312,41 @@ class TourRepository(BaseRepository):
         self.commit()
 
     def delete(self, tour_id):
-        self.cursor.execute("DELETE FROM tours WHERE tour_id=?", (tour_id,))
+        self.execute_guarded("DELETE FROM tours WHERE tour_id=?", (tour_id,))
         self.commit()
 
 
 class BookingRepository(BaseRepository):
-    def __init__(self, db_path):
-        super().__init__(db_path)
+    def __init__(self, db_path, time_budget=None):
+        super().__init__(db_path, time_budget)
 
-    def fetch_all(self):
-        self.cursor.execute("SELECT * FROM bookings")
+    def fetch_all(self, include_archived=False):
+        table_name = "bookings_history" if include_archived else "bookings"
+        self.cursor.execute(f"SELECT {', '.join(Booking.columns)} FROM {table_name}")
         rows = self.cursor.fetchall()
         return [Booking(*row) for row in rows]
 
     def fetch_by_id(self, booking_id):
-        self.cursor.execute("SELECT * FROM bookings WHERE booking_id=?", (booking_id,))
+        self.cursor.execute(f"SELECT {', '.join(Booking.columns)} FROM bookings WHERE booking_id=?", (booking_id,))
         row = self.cursor.fetchone()
         return Booking(*row) if row else None
 
     def fetch_price_by_tour_id(self, tour_id):
-        self.cursor.execute("SELECT * FROM tours WHERE tour_id=?", (tour_id,))
+        self.cursor.execute("SELECT price FROM tours WHERE tour_id=?", (tour_id,))
         row = self.cursor.fetchone()
-        column_names = [description[0] for description in self.cursor.description]
-        row_dict = dict(zip(column_names, row))
-        return row_dict.get('price')
+        return row[0] if row else None
 
     def fetch_available_places_by_tour_id(self, tour_id):
-        self.cursor.execute("SELECT * FROM tours WHERE tour_id=?", (tour_id,))
+        self.cursor.execute("SELECT available_place FROM tours WHERE tour_id=?", (tour_id,))
         row = self.cursor.fetchone()
-        column_names = [description[0] for description in self.cursor.description]
-        row_dict = dict(zip(column_names, row))
-        return row_dict.get('available_place')
+        return row[0] if row else None
 
     def fetch_occupied_places_by_tour_id(self, tour_id):
         self.cursor.execute("""
-        SELECT tour_id, SUM(people_number) AS occupied_count FROM bookings
-        WHERE status = 'confirmed' OR status = 'pending'
-        GROUP BY tour_id
-        HAVING tour_id=?
+        SELECT COALESCE(SUM(people_number), 0) FROM bookings
+        WHERE tour_id=? AND (status = 'confirmed' OR status = 'pending')
         """, (tour_id,))
-        row = self.cursor.fetchone()
-        return row[1]
+        return self.cursor.fetchone()[0]
 
     def fetch_clients_id_list(self):
         self.cursor.execute("SELECT client_id FROM clients")
@@ -190,6 +365,77 @@ class BookingRepository(BaseRepository):
         """, (booking.client_id, booking.tour_id, booking.booking_date, booking.people_number, booking.total_price, booking.status))
         self.commit()
 
+    def reserve_seats(self, booking, max_wait=5.0, backoff=0.01, busy_timeout_ms=50):
+        # A short busy timeout per attempt keeps the whole call bounded by max_wait
+        self.cursor.execute("PRAGMA busy_timeout")
+        default_timeout_ms = self.cursor.fetchone()[0]
+        self.cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        deadline = time.perf_counter() + max_wait
+        attempt = 0
+        try:
+            while True:
+                try:
+                    self.cursor.execute("BEGIN IMMEDIATE")
+                    self.cursor.execute("""
+                    INSERT INTO bookings (client_id, tour_id, booking_date, people_number, total_price, status)
+                    SELECT ?, ?, ?, ?, ?, ?
+                    WHERE (SELECT available_place FROM tours WHERE tour_id=?) - (
+                        SELECT COALESCE(SUM(people_number), 0) FROM bookings
+                        WHERE tour_id=? AND (status = 'confirmed' OR status = 'pending')
+                    ) >= ?
+                    """, (booking.client_id, booking.tour_id, booking.booking_date, booking.people_number,
+                          booking.total_price, booking.status, booking.tour_id, booking.tour_id,
+                          int(booking.people_number)))
+                    reserved = self.cursor.rowcount == 1
+                    self.commit()
+                    return reserved
+                except BaseException as e:
+                    # Any failure, e.g. a foreign key error, must release the write lock taken by BEGIN IMMEDIATE
+                    if self.conn.in_transaction:
+                        self.conn.rollback()
+                    if not isinstance(e, sqlite3.OperationalError) or ("locked" not in str(e) and "busy" not in str(e)):
+                        raise
+                    pause = min(backoff * 2 ** attempt, 0.2)
+                    if time.perf_counter() + pause >= deadline:
+                        raise sqlite3.OperationalError("database is locked: seats were not reserved")
+                    time.sleep(pause)
+                    attempt += 1
+        finally:
+            self.cursor.execute(f"PRAGMA busy_timeout = {default_timeout_ms}")
+
+    def update_columns(self, table_name, id_name, changes_by_id):
+        # A booking that becomes active on a tour (by status or tour_id) must still fit into it,
+        # checked in the same write as the update so concurrent saves cannot overbook
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            for booking_id, changes in changes_by_id.items():
+                assignments = ", ".join(f"{column}=?" for column in changes)
+                new_status = changes.get("status")
+                new_tour_id = changes.get("tour_id")
+                self.cursor.execute(f"""
+                UPDATE bookings SET {assignments}
+                WHERE booking_id=? AND (
+                    COALESCE(?, status) NOT IN ('confirmed', 'pending')
+                    OR (status IN ('confirmed', 'pending') AND tour_id = COALESCE(?, tour_id))
+                    OR (SELECT available_place FROM tours WHERE tour_id = COALESCE(?, bookings.tour_id)) - (
+                        SELECT COALESCE(SUM(b.people_number), 0) FROM bookings b
+                        WHERE b.tour_id = COALESCE(?, bookings.tour_id) AND b.booking_id != bookings.booking_id
+                            AND (b.status = 'confirmed' OR b.status = 'pending')
+                    ) >= people_number
+                )
+                """, (*changes.values(), booking_id, new_status, new_tour_id, new_tour_id, new_tour_id))
+                if self.cursor.rowcount != 1:
+                    self.cursor.execute("SELECT 1 FROM bookings WHERE booking_id=?", (booking_id,))
+                    if self.cursor.fetchone() is None:
+                        raise RecordNotFoundError(f"Record {booking_id} no longer exists in bookings")
+                    self.conn.rollback()
+                    return False
+            self.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return True
+
     def update(self, booking):
         self.cursor.execute("""
         UPDATE bookings
@@ -199,21 +445,22 @@ class BookingRepository(BaseRepository):
         self.commit()
 
     def delete(self, booking_id):
-        self.cursor.execute("DELETE FROM bookings WHERE booking_id=?", (booking_id,))
+        self.execute_guarded("DELETE FROM bookings WHERE booking_id=?", (booking_id,))
         self.commit()
 
 
 class PaymentRepository(BaseRepository):
-    def __init__(self, db_path):
-        super().__init__(db_path)
+    def __init__(self, db_path, time_budget=None):
+        super().__init__(db_path, time_budget)
 
-    def fetch_all(self):
-        self.cursor.execute("SELECT * FROM payments")
+    def fetch_all(self, include_archived=False):
+        table_name = "payments_history" if include_archived else "payments"
+        self.cursor.execute(f"SELECT {', '.join(Payment.columns)} FROM {table_name}")
         rows = self.cursor.fetchall()
         return [Payment(*row) for row in rows]
 
     def fetch_by_id(self, payment_id):
-        self.cursor.execute("SELECT * FROM payments WHERE payment_id=?", (payment_id,))
+        self.cursor.execute(f"SELECT {', '.join(Payment.columns)} FROM payments WHERE payment_id=?", (payment_id,))
         row = self.cursor.fetchone()
         return Payment(*row) if row else None
 
@@ -243,5 +490,81 @@ class PaymentRepository(BaseRepository):
         self.commit()
 
     def delete(self, payment_id):
-        self.cursor.execute("DELETE FROM payments WHERE payment_id=?", (payment_id,))
+        self.execute_guarded("DELETE FROM payments WHERE payment_id=?", (payment_id,))
+        self.commit()
+
+
+class ArchiveRepository(BaseRepository):
+    def __init__(self, db_path, archive_path):
+        super().__init__(db_path)
+        self.attach_archive(archive_path)
+        self.reserve_archived_ids()
+
+    def reserve_archived_ids(self):
+        # Archived ids must never be handed out again, so the AUTOINCREMENT counters start above them
+        for table_name, id_name in (("bookings", "booking_id"), ("payments", "payment_id")):
+            self.cursor.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (table_name,))
+            if "AUTOINCREMENT" not in self.cursor.fetchone()[0].upper():
+                raise sqlite3.OperationalError(f"{table_name} must use AUTOINCREMENT before archiving, "
+                                               f"apply the pending migrations first")
+            self.cursor.execute(f"SELECT MAX({id_name}) FROM archive.{table_name}")
+            archived_max = self.cursor.fetchone()[0]
+            if archived_max is None:
+                continue
+            self.cursor.execute("UPDATE main.sqlite_sequence SET seq=? WHERE name=? AND seq<?",
+                                (archived_max, table_name, archived_max))
+            self.cursor.execute("SELECT COUNT(*) FROM main.sqlite_sequence WHERE name=?", (table_name,))
+            if not self.cursor.fetchone()[0]:
+                self.cursor.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES (?, ?)",
+                                    (table_name, archived_max))
         self.commit()
+
+    def __check_collisions(self, table_name, id_name, booking_ids, placeholders):
+        self.cursor.execute(f"""
+        SELECT a.{id_name} FROM archive.{table_name} a JOIN main.{table_name} m ON m.{id_name} = a.{id_name}
+        WHERE m.booking_id IN ({placeholders})
+        """, booking_ids)
+        collisions = [row[0] for row in self.cursor.fetchall()]
+        if collisions:
+            raise sqlite3.IntegrityError(f"{table_name} already archived under the same id: {collisions}")
+
+    def fetch_settled_booking_ids(self, before_date, after_id, batch_size):
+        self.cursor.execute("""
+        SELECT booking_id FROM main.bookings
+        WHERE booking_id > ? AND booking_date < ? AND (status = 'completed' OR status = 'cancelled')
+        ORDER BY booking_id
+        LIMIT ?
+        """, (after_id, before_date, batch_size))
+        rows = self.cursor.fetchall()
+        return [row[0] for row in rows]
+
+    def archive_batch(self, booking_ids):
+        placeholders = ", ".join("?" * len(booking_ids))
+        booking_columns = ", ".join(Booking.columns)
+        payment_columns = ", ".join(Payment.columns)
+        try:
+            self.__check_collisions("bookings", "booking_id", booking_ids, placeholders)
+            self.__check_collisions("payments", "payment_id", booking_ids, placeholders)
+            self.cursor.execute(f"INSERT INTO archive.bookings ({booking_columns}) SELECT {booking_columns} "
+                                f"FROM main.bookings WHERE booking_id IN ({placeholders})", booking_ids)
+            self.cursor.execute(f"INSERT INTO archive.payments ({payment_columns}) SELECT {payment_columns} "
+                                f"FROM main.payments WHERE booking_id IN ({placeholders})", booking_ids)
+            self.cursor.execute(f"DELETE FROM main.payments WHERE booking_id IN ({placeholders})", booking_ids)
+            self.cursor.execute(f"DELETE FROM main.bookings WHERE booking_id IN ({placeholders})", booking_ids)
+            self.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def archive_settled(self, before_date, batch_size=500, pause=0.0):
+        archived = 0
+        last_id = 0
+        while True:
+            booking_ids = self.fetch_settled_booking_ids(before_date, last_id, batch_size)
+            if not booking_ids:
+                return archived
+            self.archive_batch(booking_ids)
+            archived += len(booking_ids)
+            last_id = booking_ids[-1]
+            if pause:
+                time.sleep(pause)
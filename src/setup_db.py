@@ -41,7 +41,7 @@ def recreate_all(db_path):
 
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS bookings (
-        booking_id INTEGER PRIMARY KEY,
+        booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
         client_id INTEGER NOT NULL,
         tour_id INTEGER NOT NULL,
         booking_date DATE NOT NULL,
@@ -56,7 +56,7 @@ def recreate_all(db_path):
 
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS payments (
-        payment_id INTEGER PRIMARY KEY,
+        payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
         booking_id INTEGER NOT NULL,
         payment_date DATE NOT NULL,
         amount INTEGER NOT NULL,
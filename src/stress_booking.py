@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from repositories import BookingRepository, TourRepository
+from models import Booking, Tour
+from setup_db import recreate_all, insert_initial_data
+
+
+def run_stress(db_path, threads=8, attempts_per_thread=200, capacity=1000):
+    tour_repo = TourRepository(db_path)
+    tour_repo.insert(Tour(None, 'Stress Tour', 'Chicago', 'Tokyo', '2024-06-01', '2024-06-10', 100, capacity))
+    tour_id = tour_repo.cursor.lastrowid
+    tour_repo.close()
+
+    reserved = [0] * threads
+    rejected = [0] * threads
+
+    def worker(index):
+        repo = BookingRepository(db_path)
+        for _ in range(attempts_per_thread):
+            booking = Booking(None, 1, tour_id, '2024-01-01', 1, 100, 'confirmed')
+            if repo.reserve_seats(booking):
+                reserved[index] += 1
+            else:
+                rejected[index] += 1
+        repo.close()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    booking_repo = BookingRepository(db_path)
+    occupied = booking_repo.fetch_occupied_places_by_tour_id(tour_id)
+    booking_repo.close()
+
+    return {
+        "threads": threads,
+        "reserved": sum(reserved),
+        "rejected": sum(rejected),
+        "occupied": occupied,
+        "capacity": capacity,
+        "seconds": elapsed,
+        "bookings_per_second": sum(reserved) / elapsed if elapsed else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "stress.db")
+        recreate_all(path)
+        insert_initial_data(path)
+        result = run_stress(path, threads=threads)
+
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    if result["occupied"] > result["capacity"]:
+        print("OVERBOOKED")
+        sys.exit(1)
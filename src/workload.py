@@ -0,0 +1,187 @@
+import argparse
+import json
+import math
+import queue
+import threading
+import time
+from repositories import ClientRepository, TourRepository, BookingRepository, PaymentRepository
+from controllers import ClientController, TourController, BookingController, PaymentController
+
+
+RECORDED_OPERATIONS = ("get_all", "add", "update", "update_changes", "delete", "delete_many",
+                       "get_delete_impact", "filter")
+
+
+def create_controllers(db_path):
+    return {
+        "clients": ClientController(ClientRepository(db_path)),
+        "tours": TourController(TourRepository(db_path)),
+        "bookings": BookingController(BookingRepository(db_path)),
+        "payments": PaymentController(PaymentRepository(db_path))
+    }
+
+
+def to_json_value(value):
+    if hasattr(value, "__dict__"):
+        return list(value.__dict__.values())
+    return value
+
+
+class WorkloadRecorder:
+    def __init__(self, capture_path):
+        self.file = open(capture_path, "a", buffering=1)
+        self.lock = threading.Lock()
+
+    def record(self, table_name, operation, args, kwargs):
+        entry = {
+            # Wall-clock time, so sessions appended to one file keep their real order
+            "t": round(time.time(), 6),
+            "tb": table_name,
+            "op": operation,
+            "a": [to_json_value(arg) for arg in args],
+        }
+        if kwargs:
+            entry["kw"] = kwargs
+        line = json.dumps(entry, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingController:
+    def __init__(self, controller, recorder):
+        self.controller = controller
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        attr = getattr(self.controller, name)
+        if name not in RECORDED_OPERATIONS:
+            return attr
+
+        def recorded(*args, **kwargs):
+            self.recorder.record(self.controller.table_name, name, args, kwargs)
+            return attr(*args, **kwargs)
+
+        return recorded
+
+
+def read_workload(capture_path):
+    with open(capture_path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class WorkloadReplayer:
+    def __init__(self, db_path, entries, speed=1.0, concurrency=1, max_idle=5.0):
+        self.db_path = db_path
+        self.entries = sorted(entries, key=lambda entry: entry["t"])
+        self.speed = speed
+        self.max_idle = max_idle
+        self.concurrency = concurrency
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def call(self, controllers, entry):
+        controller = controllers[entry["tb"]]
+        operation = entry["op"]
+        args = entry["a"]
+        if operation in ("add", "update"):
+            args = [controller.get_model(*args[0])]
+        elif operation == "update_changes":
+            args = [{int(model_id): {int(col): text for col, text in changes.items()}
+                     for model_id, changes in args[0].items()}]
+        getattr(controller, operation)(*args, **entry.get("kw", {}))
+
+    def worker(self, tasks):
+        controllers = create_controllers(self.db_path)
+        while True:
+            entry = tasks.get()
+            if entry is None:
+                break
+            key = f"{entry['tb']}.{entry['op']}"
+            started = time.perf_counter()
+            try:
+                self.call(controllers, entry)
+                failed = False
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                if failed:
+                    self.errors[key] = self.errors.get(key, 0) + 1
+                else:
+                    self.latencies.setdefault(key, []).append(elapsed)
+        for controller in controllers.values():
+            controller.repo.close()
+
+    def get_schedule(self):
+        # Offsets from the first operation, with idle gaps (e.g. between app sessions) capped at max_idle
+        schedule = []
+        offset = 0.0
+        previous_time = self.entries[0]["t"] if self.entries else 0
+        for entry in self.entries:
+            gap = entry["t"] - previous_time
+            offset += min(gap, self.max_idle) if self.max_idle is not None else gap
+            previous_time = entry["t"]
+            schedule.append(offset)
+        return schedule
+
+    def run(self):
+        tasks = queue.Queue(maxsize=self.concurrency * 4)
+        workers = [threading.Thread(target=self.worker, args=(tasks,)) for _ in range(self.concurrency)]
+        for thread in workers:
+            thread.start()
+
+        started = time.perf_counter()
+        for entry, offset in zip(self.entries, self.get_schedule()):
+            if self.speed:
+                delay = offset / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            tasks.put(entry)
+        for _ in workers:
+            tasks.put(None)
+        for thread in workers:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        result = {"seconds": elapsed, "operations": {}}
+        for key in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(key, []))
+            result["operations"][key] = {
+                "count": len(latencies),
+                "errors": self.errors.get(key, 0),
+                "throughput": len(latencies) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a captured admin workload against a database")
+    parser.add_argument("capture_path")
+    parser.add_argument("db_path", help="a synthetic database or a copy of production, it will be modified")
+    parser.add_argument("--speed", type=float, default=1.0, help="time acceleration, 0 replays without pauses")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--max-idle", type=float, default=5.0, help="longest pause replayed between operations")
+    options = parser.parse_args()
+
+    replayer = WorkloadReplayer(options.db_path, read_workload(options.capture_path), options.speed,
+                                options.concurrency, options.max_idle)
+    summary = replayer.run()
+    print(f"Replayed in {summary['seconds']:.2f} s")
+    for name, stats in summary["operations"].items():
+        print(f"{name}: {stats['count']} ok, {stats['errors']} errors, {stats['throughput']:.1f} op/s, "
+              f"p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")